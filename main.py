@@ -1,8 +1,10 @@
 import streamlit as st
 import requests
+import numpy as np
 import pandas as pd
 import plotly.graph_objs as go
 from pymongo import MongoClient
+from pymongo.errors import OperationFailure
 from datetime import datetime, timedelta
 
 # Configurações iniciais
@@ -12,35 +14,95 @@ st.set_page_config(
     layout="wide",
 )
 
-# Configuração do cliente MongoDB
-client = MongoClient("mongodb://localhost:27017/crypto_db")
-db = client["crypto_db"]  # Nome do banco de dados
-collection = db["crypto_data"]  # Nome da coleção
+MONGODB_URI = "mongodb://localhost:27017/crypto_db"
+AUTO_REFRESH_INTERVAL = 60  # Intervalo de atualização automática em segundos
+# O cache expira um pouco antes do próximo tick do timer; com TTL igual ao intervalo,
+# o tick seguinte ainda encontraria a entrada válida e redesenharia dados antigos
+FETCH_CACHE_TTL = AUTO_REFRESH_INTERVAL - 5
+OPEN_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"  # Formato de open_time gravado pelo coletor
 
+# Campos lidos do MongoDB (apenas os usados pelo gráfico)
+PROJECTED_COLUMNS = [
+    "open_time",
+    "open",
+    "high",
+    "low",
+    "close",
+    "Upper",
+    "Lower",
+    "MA20",
+]
 
-# Função para buscar dados do MongoDB
-def fetch_data_from_mongodb(collection, limit=100):
+
+# Configuração do cliente MongoDB (um único cliente e pool de conexões por processo)
+@st.cache_resource(show_spinner=False)
+def get_mongodb_client():
+    return MongoClient(
+        MONGODB_URI,
+        maxPoolSize=10,
+        minPoolSize=1,
+        maxIdleTimeMS=60000,
+        serverSelectionTimeoutMS=5000,
+    )
+
+
+@st.cache_resource(show_spinner=False)
+def get_collection():
+    db = get_mongodb_client()["crypto_db"]  # Nome do banco de dados
+    collection = db["crypto_data"]  # Nome da coleção
+    # Índice para que o servidor ordene por open_time sem varrer a coleção
     try:
-        data = list(
-            collection.find().sort("_id", -1).limit(limit)
-        )  # Busca os últimos 'limit' documentos
-        df = pd.DataFrame(data)
-        df.drop("_id", axis=1, inplace=True)  # Remova a coluna _id
-        return df
-    except Exception as e:
-        print(f"An error occurred while fetching data from MongoDB: {e}")
-        return pd.DataFrame()
+        collection.create_index([("open_time", -1)])
+    except OperationFailure as e:
+        # Usuário só com permissão de leitura: segue sem o índice
+        print(f"Could not create the open_time index: {e}")
+    return collection
 
 
-# Função para identificar sinais de compra/venda
+# Função para buscar dados do MongoDB (reaproveitada entre reruns até expirar o TTL)
+# Erros não são tratados aqui: o cache_data não guarda exceções, então o próximo rerun
+# tenta de novo em vez de reaproveitar um resultado vazio
+@st.cache_data(ttl=FETCH_CACHE_TTL, show_spinner=False)
+def fetch_data_from_mongodb(limit=100):
+    # Os buffers abaixo têm tamanho 'limit'; no PyMongo, limit(0) significaria "sem limite"
+    if limit <= 0:
+        raise ValueError(f"limit must be a positive integer, got {limit}")
+    collection = get_collection()
+    projection = {"_id": 0, **{c: 1 for c in PROJECTED_COLUMNS}}
+    cursor = (
+        collection.find({}, projection=projection)
+        .sort("open_time", -1)
+        .limit(limit)
+    )  # Busca os últimos 'limit' documentos
+    # Consome o cursor em arrays pré-alocados, sem lista de dicts nem inferência de tipos
+    open_time = np.empty(limit, dtype=object)
+    buf = {c: np.empty(limit, dtype=np.float64) for c in PROJECTED_COLUMNS[1:]}
+    n = 0
+    for doc in cursor:
+        open_time[n] = doc.get("open_time")
+        for c, arr in buf.items():
+            arr[n] = doc.get(c, np.nan)
+        n += 1
+    # [::-1] deixa os dados em ordem cronológica crescente para o gráfico
+    columns = {
+        "open_time": pd.to_datetime(open_time[:n], format=OPEN_TIME_FORMAT)[::-1]
+    }
+    for c, arr in buf.items():
+        columns[c] = arr[:n][::-1]
+    # Os arrays acabaram de ser criados aqui; o DataFrame pode usá-los sem copiar
+    return pd.DataFrame(columns, copy=False)
+
+
+# Função para identificar sinais de compra/venda (retorna máscaras, sem alterar o DataFrame)
 def identify_trade_signals(df):
-    df["Buy_Signal"] = (
-        df["close"] <= df["Lower"]
+    close = df["close"].to_numpy()
+    buy_mask = np.less_equal(
+        close, df["Lower"].to_numpy()
     )  # Sinal de compra se o preço de fechamento estiver abaixo da banda inferior
-    df["Sell_Signal"] = (
-        df["close"] >= df["Upper"]
+    sell_mask = np.greater_equal(
+        close, df["Upper"].to_numpy()
     )  # Sinal de venda se o preço de fechamento estiver acima da banda superior
-    return df
+    return buy_mask, sell_mask
 
 
 # Função para plotar gráfico de disco (volume de compra vs venda)
@@ -58,120 +120,146 @@ def plot_buy_vs_sell_pie_chart(buy_volume, sell_volume):
     st.plotly_chart(fig, use_container_width=True)
 
 
-# Título da aplicação
-st.title(
-    ":chart_with_upwards_trend: Crypto Monitor with Bollinger Bands and Moving Average"
-)
+# Função para criar o gráfico de candlestick com Bandas de Bollinger, Média Móvel e sinais
+def create_candlestick_chart(df, buy_mask, sell_mask, symbol, interval):
+    # Eixo x e fechamento convertidos uma única vez e compartilhados por todas as séries
+    open_time = df["open_time"].to_numpy()
+    close = df["close"].to_numpy()
 
-# Entrada do usuário para o símbolo da criptomoeda e intervalo de tempo para o gráfico de candlestick
-crypto_symbol = st.sidebar.text_input(
-    "Enter the crypto symbol (e.g., 'BTCUSDT'):", "BTCUSDT"
-)
-interval = st.sidebar.selectbox(
-    "Select the interval for the candlestick chart:",
-    options=["1m", "5m", "15m", "1h", "1d"],
-    index=0,
-)
-
-# Botão para buscar dados da criptomoeda
-if (
-    st.sidebar.button("Get Data") or True
-):  # Remova 'or True' para desabilitar a atualização automática
-    # Buscar dados do MongoDB
-    candle_data = fetch_data_from_mongodb(collection)
-
-    # Identificar sinais de compra/venda
-    candle_data_with_signals = identify_trade_signals(candle_data)
-
-    # Criar o gráfico de candlestick com os sinais
-    fig = go.Figure(
-        data=[
-            go.Candlestick(
-                x=candle_data_with_signals["open_time"],
-                open=candle_data_with_signals["open"],
-                high=candle_data_with_signals["high"],
-                low=candle_data_with_signals["low"],
-                close=candle_data_with_signals["close"],
-            )
-        ]
-    )
+    # Índices dos sinais lidos direto dos arrays, sem montar sub-DataFrames
+    buy_idx = np.flatnonzero(buy_mask)
+    sell_idx = np.flatnonzero(sell_mask)
 
-    # Adicionar Bandas de Bollinger e Média Móvel ao gráfico
-    fig.add_trace(
+    # Todas as séries são montadas antes e passadas de uma vez ao go.Figure
+    traces = [
+        go.Candlestick(
+            x=open_time,
+            open=df["open"].to_numpy(),
+            high=df["high"].to_numpy(),
+            low=df["low"].to_numpy(),
+            close=close,
+        ),
+        # Bandas de Bollinger e Média Móvel
         go.Scatter(
-            x=candle_data_with_signals["open_time"],
-            y=candle_data_with_signals["Upper"],
+            x=open_time,
+            y=df["Upper"].to_numpy(),
             name="Upper Band",
             line=dict(color="rgba(250, 0, 0, 0.50)"),
-        )
-    )
-    fig.add_trace(
+        ),
         go.Scatter(
-            x=candle_data_with_signals["open_time"],
-            y=candle_data_with_signals["Lower"],
+            x=open_time,
+            y=df["Lower"].to_numpy(),
             name="Lower Band",
             line=dict(color="rgba(0, 0, 250, 0.50)"),
-        )
-    )
-    fig.add_trace(
+        ),
         go.Scatter(
-            x=candle_data_with_signals["open_time"],
-            y=candle_data_with_signals["MA20"],
+            x=open_time,
+            y=df["MA20"].to_numpy(),
             name="Moving Average (20)",
             line=dict(color="rgba(0, 255, 0, 0.50)"),
-        )
-    )
-
-    # Adicionar sinais de compra/venda ao gráfico
-    fig.add_trace(
+        ),
+        # Sinais de compra/venda
         go.Scatter(
             mode="markers",
-            x=candle_data_with_signals[candle_data_with_signals["Buy_Signal"]][
-                "open_time"
-            ],
-            y=candle_data_with_signals[candle_data_with_signals["Buy_Signal"]]["close"],
+            x=open_time[buy_idx],
+            y=close[buy_idx],
             marker=dict(color="green", size=10),
             name="Buy Signal",
-        )
-    )
-    fig.add_trace(
+        ),
         go.Scatter(
             mode="markers",
-            x=candle_data_with_signals[candle_data_with_signals["Sell_Signal"]][
-                "open_time"
-            ],
-            y=candle_data_with_signals[candle_data_with_signals["Sell_Signal"]][
-                "close"
-            ],
+            x=open_time[sell_idx],
+            y=close[sell_idx],
             marker=dict(color="red", size=10),
             name="Sell Signal",
-        )
-    )
+        ),
+    ]
 
-    fig.update_layout(
-        title=f"{crypto_symbol} Candlestick Chart with Bollinger Bands and Moving Average ({interval})",
+    layout = go.Layout(
+        title=f"{symbol} Candlestick Chart with Bollinger Bands and Moving Average ({interval})",
         xaxis_title="Time",
         yaxis_title="Price",
         xaxis_rangeslider_visible=False,
     )
 
+    return go.Figure(data=traces, layout=layout)
+
+
+# Impressão digital barata da janela de candles (última vela, tamanho e último fechamento)
+def chart_fingerprint(df):
+    return (df["open_time"].iat[-1].value, len(df), float(df["close"].iat[-1]))
+
+
+# Gráfico reaproveitado entre reruns enquanto a janela de dados não mudar
+# (cache_resource devolve o mesmo objeto, sem pickle; a figura nunca é alterada depois)
+@st.cache_resource(show_spinner=False, max_entries=16)
+def build_candlestick_chart(fingerprint, symbol, interval, _df, _buy_mask, _sell_mask):
+    return create_candlestick_chart(_df, _buy_mask, _sell_mask, symbol, interval)
+
+
+# Função que busca os dados e desenha o gráfico e o último preço
+def render_dashboard(symbol, interval):
+    # Buscar dados do MongoDB
+    try:
+        candle_data = fetch_data_from_mongodb()
+    except Exception as e:
+        st.error(f"An error occurred while fetching data from MongoDB: {e}")
+        return
+
+    if candle_data.empty:
+        st.warning("No candle data found in MongoDB.")
+        return
+
+    # Identificar sinais de compra/venda
+    buy_mask, sell_mask = identify_trade_signals(candle_data)
+
+    # Criar o gráfico de candlestick com os sinais
+    fig = build_candlestick_chart(
+        chart_fingerprint(candle_data),
+        symbol,
+        interval,
+        candle_data,
+        buy_mask,
+        sell_mask,
+    )
+
     st.plotly_chart(fig, use_container_width=True)
 
     # Exibir o último preço
-    last_price = candle_data_with_signals.iloc[-1]["close"]
-    st.success(f"The last close price of {crypto_symbol} is {last_price}")
+    last_price = candle_data["close"].iat[-1]
+    st.success(f"The last close price of {symbol} is {last_price}")
 
-    
 
+# Título da aplicação
+st.title(
+    ":chart_with_upwards_trend: Crypto Monitor with Bollinger Bands and Moving Average"
+)
+
+# Entrada do usuário para o símbolo da criptomoeda e intervalo de tempo para o gráfico de candlestick
+crypto_symbol = st.sidebar.text_input(
+    "Enter the crypto symbol (e.g., 'BTCUSDT'):", "BTCUSDT"
+)
+interval = st.sidebar.selectbox(
+    "Select the interval for the candlestick chart:",
+    options=["1m", "5m", "15m", "1h", "1d"],
+    index=0,
+)
+
+# Botão para buscar dados da criptomoeda (ignora o cache e força nova leitura)
+if st.sidebar.button("Get Data"):
+    fetch_data_from_mongodb.clear()
 
 # Atualizar automaticamente a cada minuto
-st_autorefresh = st.sidebar.checkbox("Auto-refresh every minute", value=True)
-if st_autorefresh:
-    refresh_interval = 60 * 1000  # 60 segundos em milissegundos
-    st.experimental_rerun()
+auto_refresh = st.sidebar.checkbox("Auto-refresh every minute", value=True)
 
 # Instruções
 st.sidebar.write("1. Enter the crypto symbol in the input box.")
 st.sidebar.write("2. Select the interval for the candlestick chart.")
 st.sidebar.write("3. Click on 'Get Data' to fetch the latest data.")
 st.sidebar.write("4. Check 'Auto-refresh every minute' for live updates.")
+
+# Só o fragmento do gráfico é reexecutado a cada intervalo; a barra lateral não roda de novo
+st.fragment(
+    render_dashboard,
+    run_every=AUTO_REFRESH_INTERVAL if auto_refresh else None,
+)(crypto_symbol, interval)